@@ -0,0 +1,92 @@
+import os
+import json
+import re
+import logging
+import tempfile
+import time
+
+# Directory holding one JSON state file per meeting transcript
+SUMMARY_STATE_DIR = os.environ.get("SUMMARY_STATE_DIR", "/tmp/summary_state")
+# State files not updated for this many hours are deleted
+SUMMARY_STATE_TTL_HOURS = float(os.environ.get("SUMMARY_STATE_TTL_HOURS", 24))
+
+
+def split_cues(transcript_content):
+    """Splits WebVTT transcript content into its cue blocks, skipping the header and notes."""
+    cues = []
+    for block in re.split(r"\r?\n\s*\r?\n", transcript_content or ""):
+        block = block.strip()
+        if not block or block.startswith("WEBVTT") or block.startswith("NOTE"):
+            continue
+        cues.append(block)
+    return cues
+
+
+def _state_path(meeting_id, transcript_id):
+    # Recurring meetings reuse the onlineMeeting id, so each transcript gets its own state
+    safe_id = re.sub(r"[^A-Za-z0-9_.-]", "_", f"{meeting_id}_{transcript_id}")
+    return os.path.join(SUMMARY_STATE_DIR, f"{safe_id}.json")
+
+
+def load_state(meeting_id, transcript_id):
+    """
+    Loads the rolling summary state for a meeting transcript.
+
+    The state has the shape {"summary": str, "offset": cue_count}.
+    A missing, unreadable or expired (older than SUMMARY_STATE_TTL_HOURS) state
+    file yields an empty state.
+    """
+    path = _state_path(meeting_id, transcript_id)
+    try:
+        if os.path.getmtime(path) < time.time() - SUMMARY_STATE_TTL_HOURS * 3600:
+            logging.info(f"Summary state for meeting {meeting_id} has expired, starting a new summary.")
+            return {"summary": "", "offset": 0}
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        state.setdefault("summary", "")
+        state.setdefault("offset", 0)
+        return state
+    except FileNotFoundError:
+        return {"summary": "", "offset": 0}
+    except Exception as e:
+        logging.error(f"Error loading summary state for meeting {meeting_id}: {e}")
+        return {"summary": "", "offset": 0}
+
+
+def save_state(meeting_id, transcript_id, state):
+    """
+    Persists the rolling summary state for a meeting transcript, replacing the file atomically.
+
+    Note: load -> summarize -> save is not locked. Pub/Sub delivers at least once,
+    so two notifications for the same transcript processed concurrently each write a
+    complete state and the last one to finish wins.
+    """
+    os.makedirs(SUMMARY_STATE_DIR, exist_ok=True)
+    path = _state_path(meeting_id, transcript_id)
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=SUMMARY_STATE_DIR, suffix=".tmp", delete=False) as f:
+        json.dump(state, f)
+    try:
+        os.replace(f.name, path)
+    except Exception:
+        os.remove(f.name)
+        raise
+    prune_states()
+
+
+def prune_states():
+    """Deletes state files that have not been updated within SUMMARY_STATE_TTL_HOURS."""
+    cutoff = time.time() - SUMMARY_STATE_TTL_HOURS * 3600
+    try:
+        entries = list(os.scandir(SUMMARY_STATE_DIR))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if not entry.name.endswith((".json", ".tmp")):
+            continue
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.error(f"Error pruning summary state {entry.name}: {e}")
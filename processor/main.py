@@ -13,6 +13,14 @@ import markdown
 import logging
 from azure.identity.aio import ClientSecretCredential
 from msgraph_beta import GraphServiceClient
+from msgraph_beta import graph_request_adapter
+from msgraph_beta.graph_request_adapter import GraphRequestAdapter
+from msgraph_core import APIVersion, GraphClientFactory
+from msgraph_core.middleware import GraphTelemetryHandler
+from msgraph_core.middleware.options import GraphTelemetryHandlerOption
+from kiota_http.kiota_client_factory import KiotaClientFactory
+from kiota_http.middleware import BaseMiddleware
+from kiota_authentication_azure.azure_identity_authentication_provider import AzureIdentityAuthenticationProvider
 from msgraph_beta.generated.models.chat_message import ChatMessage
 from msgraph_beta.generated.models.event import Event
 from msgraph_beta.generated.models.item_body import ItemBody
@@ -20,6 +28,7 @@ from kiota_abstractions.base_request_configuration import RequestConfiguration
 from kiota_abstractions.headers_collection import HeadersCollection
 from msgraph_beta.generated.users.item.events.events_request_builder import EventsRequestBuilder
 import base64
+import time
 from msgraph_beta.generated.users.item.send_mail.send_mail_post_request_body import SendMailPostRequestBody
 from msgraph_beta.generated.models.message import Message
 from msgraph_beta.generated.models.body_type import BodyType
@@ -30,6 +39,8 @@ from dotenv import load_dotenv
 from google import genai
 from google.genai import types
 from . import prompt
+from . import incremental
+from . import metrics
 from opentelemetry import trace
 from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
@@ -48,6 +59,7 @@ GOOGLE_CLOUD_PROJECT = os.environ.get("GOOGLE_CLOUD_PROJECT")
 GOOGLE_CLOUD_LOCATION = os.environ.get("GOOGLE_CLOUD_LOCATION")
 MAX_ATTENDEES = os.environ.get("MAX_ATTENDEES", 10)
 MODEL_FOR_SUMMARIZATION=os.environ.get("MODEL_FOR_SUMMARIZATION", "gemini-2.5-flash")
+INCREMENTAL_SUMMARIZATION = os.environ.get("INCREMENTAL_SUMMARIZATION", "false").lower() == "true"
 
 # --- Tracing ---
 # trace.set_tracer_provider(TracerProvider())
@@ -79,9 +91,60 @@ class DummyTracer:
 
 tracer = DummyTracer()
 
+class GraphThrottlingHandler(BaseMiddleware):
+    """Counts every throttled (HTTP 429) Graph response, including the ones the RetryHandler retries."""
+
+    async def send(self, request, transport):
+        response = await super().send(request, transport)
+        if response.status_code == 429:
+            metrics.incr("graph_throttled", method=request.method)
+        return response
+
+def create_graph_client(credential):
+    """Creates a beta GraphServiceClient with the default middleware plus throttling metrics."""
+    options = graph_request_adapter.options
+    middleware = KiotaClientFactory.get_default_middleware(options)
+    middleware.append(GraphTelemetryHandler(options=options[GraphTelemetryHandlerOption.get_key()]))
+    # Last in the pipeline, so it sees each attempt before the RetryHandler retries it
+    middleware.append(GraphThrottlingHandler())
+    http_client = GraphClientFactory.create_with_custom_middleware(middleware, api_version=APIVersion.beta)
+    auth_provider = AzureIdentityAuthenticationProvider(credential, scopes=["https://graph.microsoft.com/.default"])
+    return GraphServiceClient(request_adapter=GraphRequestAdapter(auth_provider, client=http_client))
+
 @tracer.start_as_current_span("summarize_with_gemini")
-async def summarize_with_gemini(transcript_content):
-    """Summarizes the transcript using Gemini."""
+async def summarize_with_gemini(transcript_content, meeting_id=None, transcript_id=None):
+    """
+    Summarizes the transcript using Gemini.
+
+    When INCREMENTAL_SUMMARIZATION is enabled and a meeting_id is given, a rolling
+    summary is kept per meeting transcript and only the cues added since the last
+    call are sent to Gemini and folded into it.
+    """
+    state = None
+    new_offset = 0
+    prompt_text = prompt.PROMPT.format(transcript_content=transcript_content)
+    if INCREMENTAL_SUMMARIZATION and meeting_id:
+        state = incremental.load_state(meeting_id, transcript_id or "")
+        cues = incremental.split_cues(transcript_content)
+        offset = state["offset"]
+        if offset > len(cues):
+            # The transcript shrank, so the stored offset and summary no longer apply
+            offset = 0
+            state["summary"] = ""
+        new_offset = len(cues)
+        delta = cues[offset:]
+        if not delta and state["summary"]:
+            logging.info(f"No new transcript cues for meeting {meeting_id}, reusing running summary.")
+            return state["summary"]
+        if state["summary"]:
+            logging.info(f"Summarizing {len(delta)} new cues for meeting {meeting_id} (offset {offset}).")
+            prompt_text = prompt.INCREMENTAL_PROMPT.format(
+                running_summary=state["summary"],
+                transcript_delta="\n\n".join(delta)
+            )
+        else:
+            prompt_text = prompt.PROMPT.format(transcript_content="\n\n".join(delta))
+
     try:
         client = genai.Client(
             vertexai=True,project=GOOGLE_CLOUD_PROJECT,location=GOOGLE_CLOUD_LOCATION
@@ -91,7 +154,7 @@ async def summarize_with_gemini(transcript_content):
             types.Content(
                 role="user",
                 parts=[
-                    types.Part.from_text(text=prompt.PROMPT.format(transcript_content=transcript_content))
+                    types.Part.from_text(text=prompt_text)
                 ]
             )
         ]
@@ -106,13 +169,31 @@ async def summarize_with_gemini(transcript_content):
         )
 
         response = ""
+        usage = None
+        started = time.monotonic()
         for chunk in client.models.generate_content_stream(
             model=model,
             contents=contents,
             config=generate_content_config,
         ):
-            response += chunk.text
+            if not response and chunk.text:
+                metrics.observe("gemini_time_to_first_token_seconds", time.monotonic() - started)
+            response += chunk.text or ""
+            if chunk.usage_metadata:
+                usage = chunk.usage_metadata
+        metrics.incr("gemini_calls")
+        if usage:
+            metrics.incr("gemini_input_tokens", usage.prompt_token_count or 0)
+            metrics.incr("gemini_output_tokens", usage.candidates_token_count or 0)
         logging.debug(response)
+
+        if state is not None and response:
+            state["summary"] = response
+            state["offset"] = new_offset
+            try:
+                incremental.save_state(meeting_id, transcript_id or "", state)
+            except Exception as e:
+                logging.error(f"Error saving summary state for meeting {meeting_id}: {e}")
         return response
 
     except Exception as e:
@@ -146,7 +227,8 @@ async def update_meeting_notes(graph_client, user_id, meeting_info, summary):
             query_parameters=query_params
         )
         
-        events = await graph_client.users.by_user_id(user_id).events.get(request_configuration=request_configuration)
+        with metrics.graph_call("GET /users/{id}/events"):
+            events = await graph_client.users.by_user_id(user_id).events.get(request_configuration=request_configuration)
 
         if events and events.value:
             meeting_event = events.value[0]
@@ -170,7 +252,8 @@ async def update_meeting_notes(graph_client, user_id, meeting_info, summary):
             )
             
             # Patch the event with the new body
-            await graph_client.users.by_user_id(user_id).events.by_event_id(event_id).patch(update_payload)
+            with metrics.graph_call("PATCH /users/{id}/events/{id}"):
+                await graph_client.users.by_user_id(user_id).events.by_event_id(event_id).patch(update_payload)
             logging.info(f"Successfully updated meeting notes for event: {event_id}")
         else:
             logging.warning("Could not find a matching calendar event for the meeting.")
@@ -223,7 +306,8 @@ async def send_summary_email(graph_client, organizer_id, organizer_email, meetin
             save_to_sent_items=True
         )
 
-        await graph_client.users.by_user_id(organizer_id).send_mail.post(request_body)
+        with metrics.graph_call("POST /users/{id}/sendMail"):
+            await graph_client.users.by_user_id(organizer_id).send_mail.post(request_body)
         logging.info(f"Summary email sent successfully to {organizer_email}")
 
     except Exception as e:
@@ -247,28 +331,34 @@ async def fetch_transcript(resource_url):
             client_id=CLIENT_ID,
             client_secret=CLIENT_SECRET,
         )
-        graph_client = GraphServiceClient(credentials=credential, scopes=["https://graph.microsoft.com/.default"])
+        graph_client = create_graph_client(credential)
 
         try:
+            metrics.start_meeting(meeting_id)
+
             # Fetch transcript content
             headers = HeadersCollection()
             headers.add("Accept", "text/vtt")
             request_configuration = RequestConfiguration(headers=headers)
-            transcript_content_bytes = await graph_client.users.by_user_id(user_id).online_meetings.by_online_meeting_id(meeting_id).transcripts.by_call_transcript_id(transcript_id).content.get(request_configuration=request_configuration)
+            with metrics.stage("fetch_transcript"), metrics.graph_call("GET /users/{id}/onlineMeetings/{id}/transcripts/{id}/content"):
+                transcript_content_bytes = await graph_client.users.by_user_id(user_id).online_meetings.by_online_meeting_id(meeting_id).transcripts.by_call_transcript_id(transcript_id).content.get(request_configuration=request_configuration)
             
             transcript_content = ""
             if transcript_content_bytes:
                 transcript_content = transcript_content_bytes.decode('utf-8')
+            metrics.observe("transcript_bytes", len(transcript_content_bytes or b""))
 
             # Summarize the transcript (optional, continue if it fails)
             summary = None
             try:
-                summary = await summarize_with_gemini(transcript_content)
+                with metrics.stage("summarize"):
+                    summary = await summarize_with_gemini(transcript_content, meeting_id=meeting_id, transcript_id=transcript_id)
             except Exception as e:
                 logging.error(f"Unexpected error during summarization: {e}")
             
             # Fetch meeting participants and their recordings folder
-            meeting_info = await graph_client.users.by_user_id(user_id).online_meetings.by_online_meeting_id(meeting_id).get()
+            with metrics.stage("fetch_meeting"), metrics.graph_call("GET /users/{id}/onlineMeetings/{id}"):
+                meeting_info = await graph_client.users.by_user_id(user_id).online_meetings.by_online_meeting_id(meeting_id).get()
             
             # Send summary to Teams channel
             # if summary and meeting_info and meeting_info.chat_info:
@@ -287,7 +377,8 @@ async def fetch_transcript(resource_url):
 
             # Update meeting notes with summary
             if summary and meeting_info:
-                await update_meeting_notes(graph_client, user_id, meeting_info, summary)
+                with metrics.stage("update_meeting_notes"):
+                    await update_meeting_notes(graph_client, user_id, meeting_info, summary)
 
             # Send summary email to organizer
             if summary and meeting_info and meeting_info.participants and meeting_info.participants.organizer:
@@ -296,20 +387,22 @@ async def fetch_transcript(resource_url):
                     organizer_id = organizer_identity.user.id
                     try:
                         # Fetch organizer's user object to get their email
-                        organizer_user = await graph_client.users.by_user_id(organizer_id).get()
+                        with metrics.graph_call("GET /users/{id}"):
+                            organizer_user = await graph_client.users.by_user_id(organizer_id).get()
                         organizer_email = organizer_user.mail
                         if organizer_email:
                             base_filename = f"{meeting_info.subject}_{meeting_info.start_date_time.strftime('%Y%m%d_%H%M%S')}"
                             transcript_filename = f"{base_filename}_transcript.txt"
-                            await send_summary_email(
-                                graph_client=graph_client,
-                                organizer_id=organizer_id,
-                                organizer_email=organizer_email,
-                                meeting_subject=meeting_info.subject,
-                                summary=summary,
-                                transcript_content=transcript_content,
-                                transcript_filename=transcript_filename
-                            )
+                            with metrics.stage("send_summary_email"):
+                                await send_summary_email(
+                                    graph_client=graph_client,
+                                    organizer_id=organizer_id,
+                                    organizer_email=organizer_email,
+                                    meeting_subject=meeting_info.subject,
+                                    summary=summary,
+                                    transcript_content=transcript_content,
+                                    transcript_filename=transcript_filename
+                                )
                     except Exception as e:
                         logging.error(f"Error preparing or sending summary email: {e}")
                         
@@ -325,20 +418,24 @@ async def fetch_transcript(resource_url):
                     organizer_id = meeting_info.participants.organizer.identity.user.id
                     
                     logging.info(f"  - {display_name if display_name else organizer_id}")
-                    org_drive = await graph_client.users.by_user_id(organizer_id).drive.get()
+                    with metrics.graph_call("GET /users/{id}/drive"):
+                        org_drive = await graph_client.users.by_user_id(organizer_id).drive.get()
                     logging.info(f"    Drive ID: {org_drive.id}")
-                    recordings_folder = await graph_client.drives.by_drive_id(org_drive.id).special.by_drive_item_id('recordings').get()
+                    with metrics.graph_call("GET /drives/{id}/special/recordings"):
+                        recordings_folder = await graph_client.drives.by_drive_id(org_drive.id).special.by_drive_item_id('recordings').get()
                     if recordings_folder and recordings_folder.id:
                         drive_id = recordings_folder.parent_reference.drive_id
                         recordings_folder_id = recordings_folder.id
                         # Upload the transcript
-                        await graph_client.drives.by_drive_id(drive_id).items.by_drive_item_id(recordings_folder_id).children.by_drive_item_id1(transcript_filename).content.put(transcript_content_bytes)
+                        with metrics.upload(organizer_id, "transcript"), metrics.graph_call("PUT /drives/{id}/items/{id}/content"):
+                            await graph_client.drives.by_drive_id(drive_id).items.by_drive_item_id(recordings_folder_id).children.by_drive_item_id1(transcript_filename).content.put(transcript_content_bytes)
                         logging.info(f"Transcript uploaded successfully: {transcript_filename}")
                         
                         # Upload the summary
                         if summary:
                             summary_bytes = summary.encode('utf-8')
-                            await graph_client.drives.by_drive_id(drive_id).items.by_drive_item_id(recordings_folder_id).children.by_drive_item_id1(summary_filename).content.put(summary_bytes)
+                            with metrics.upload(organizer_id, "summary"), metrics.graph_call("PUT /drives/{id}/items/{id}/content"):
+                                await graph_client.drives.by_drive_id(drive_id).items.by_drive_item_id(recordings_folder_id).children.by_drive_item_id1(summary_filename).content.put(summary_bytes)
                             logging.info(f"Summary uploaded successfully: {summary_filename}")
 
                 logging.info("Meeting Attendees:")
@@ -352,26 +449,32 @@ async def fetch_transcript(resource_url):
                                 display_name = attendee.identity.user.display_name
                                 logging.info(f"  - {display_name if display_name else attendee_id}")
                                 try:
-                                    att_drive = await graph_client.users.by_user_id(attendee_id).drive.get()
+                                    with metrics.graph_call("GET /users/{id}/drive"):
+                                        att_drive = await graph_client.users.by_user_id(attendee_id).drive.get()
                                     logging.info(f"    Drive ID: {att_drive.id}")
-                                    recordings_folder = await graph_client.drives.by_drive_id(att_drive.id).special.by_drive_item_id('recordings').get()
+                                    with metrics.graph_call("GET /drives/{id}/special/recordings"):
+                                        recordings_folder = await graph_client.drives.by_drive_id(att_drive.id).special.by_drive_item_id('recordings').get()
                                     if recordings_folder and recordings_folder.id:
                                         drive_id = recordings_folder.parent_reference.drive_id
                                         recordings_folder_id = recordings_folder.id
                                         # Upload the transcript
-                                        await graph_client.drives.by_drive_id(drive_id).items.by_drive_item_id(recordings_folder_id).children.by_drive_item_id1(transcript_filename).content.put(transcript_content_bytes)
+                                        with metrics.upload(attendee_id, "transcript"), metrics.graph_call("PUT /drives/{id}/items/{id}/content"):
+                                            await graph_client.drives.by_drive_id(drive_id).items.by_drive_item_id(recordings_folder_id).children.by_drive_item_id1(transcript_filename).content.put(transcript_content_bytes)
                                         logging.info(f"Transcript uploaded successfully: {transcript_filename} for attendee: {display_name if display_name else attendee_id}")
     
                                         # Upload the summary
                                         if summary:
                                             summary_bytes = summary.encode('utf-8')
-                                            await graph_client.drives.by_drive_id(drive_id).items.by_drive_item_id(recordings_folder_id).children.by_drive_item_id1(summary_filename).content.put(summary_bytes)
+                                            with metrics.upload(attendee_id, "summary"), metrics.graph_call("PUT /drives/{id}/items/{id}/content"):
+                                                await graph_client.drives.by_drive_id(drive_id).items.by_drive_item_id(recordings_folder_id).children.by_drive_item_id1(summary_filename).content.put(summary_bytes)
                                             logging.info(f"Summary uploaded successfully: {summary_filename} for attendee: {display_name if display_name else attendee_id}")
                                 except Exception as e:
                                     logging.error(f"Error uploading to attendee {display_name}'s drive: {e}")
 
         except Exception as e:
             logging.error(f"Error fetching transcript or participants: {e}")
+        finally:
+            metrics.emit()
 
 @functions_framework.cloud_event
 def main(cloud_event):
@@ -0,0 +1,158 @@
+import sys
+import json
+import time
+import logging
+import contextvars
+from contextlib import contextmanager
+
+_current = contextvars.ContextVar("meeting_metrics", default=None)
+
+# Summary records are written as bare JSON lines on stdout, which Cloud Logging parses as structured entries
+logger = logging.getLogger("metrics")
+logger.propagate = False
+if not logger.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+
+
+class MeetingMetrics:
+    """Counters, histograms and per-stage timings collected while processing one meeting."""
+
+    def __init__(self, meeting_id):
+        self.meeting_id = meeting_id
+        self.started = time.monotonic()
+        self.counters = {}
+        self.histograms = {}
+        self.stages = {}
+        self.uploads = []
+
+    def incr(self, name, value=1, **labels):
+        series = self.counters.setdefault(name, {})
+        key = _key(labels)
+        series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        self.histograms.setdefault(name, {}).setdefault(_key(labels), []).append(value)
+
+    def record(self):
+        """Builds the Cloud Logging-compatible summary record for this meeting."""
+        return {
+            "severity": "INFO",
+            "message": f"Meeting metrics for {self.meeting_id}",
+            "logging.googleapis.com/labels": {"component": "metrics"},
+            "meeting_id": self.meeting_id,
+            "total_seconds": round(time.monotonic() - self.started, 3),
+            "stages": {name: round(seconds, 3) for name, seconds in self.stages.items()},
+            "counters": {
+                name: [{**dict(key), "value": value} for key, value in series.items()]
+                for name, series in self.counters.items()
+            },
+            "histograms": {
+                name: [{**dict(key), **_summarize(values)} for key, values in series.items()]
+                for name, series in self.histograms.items()
+            },
+            "uploads": self.uploads,
+        }
+
+
+def _key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _summarize(values):
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "sum": round(sum(ordered), 3),
+        "min": round(ordered[0], 3),
+        "max": round(ordered[-1], 3),
+        "p50": round(ordered[len(ordered) // 2], 3),
+    }
+
+
+def start_meeting(meeting_id):
+    """Starts collecting metrics for a meeting in the current context."""
+    meeting_metrics = MeetingMetrics(meeting_id)
+    _current.set(meeting_metrics)
+    return meeting_metrics
+
+
+def incr(name, value=1, **labels):
+    meeting_metrics = _current.get()
+    if meeting_metrics:
+        meeting_metrics.incr(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    meeting_metrics = _current.get()
+    if meeting_metrics:
+        meeting_metrics.observe(name, value, **labels)
+
+
+@contextmanager
+def stage(name):
+    """Times a processing stage and adds it to the per-meeting breakdown."""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        elapsed = time.monotonic() - started
+        meeting_metrics = _current.get()
+        if meeting_metrics:
+            meeting_metrics.stages[name] = meeting_metrics.stages.get(name, 0) + elapsed
+            meeting_metrics.observe("stage_seconds", elapsed, stage=name)
+
+
+@contextmanager
+def graph_call(endpoint):
+    """
+    Counts and times a Microsoft Graph call.
+
+    Individual 429 responses are counted by the Graph client middleware; a call that
+    still fails with 429 after the SDK's retries is counted as graph_throttled_exhausted.
+    """
+    started = time.monotonic()
+    incr("graph_calls", endpoint=endpoint)
+    try:
+        yield
+    except Exception as e:
+        if getattr(e, "response_status_code", None) == 429:
+            incr("graph_throttled_exhausted", endpoint=endpoint)
+        else:
+            incr("graph_errors", endpoint=endpoint)
+        raise
+    finally:
+        observe("graph_call_seconds", time.monotonic() - started, endpoint=endpoint)
+
+
+@contextmanager
+def upload(recipient, kind):
+    """Times an upload of the transcript or summary to a recipient's drive."""
+    started = time.monotonic()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        elapsed = time.monotonic() - started
+        meeting_metrics = _current.get()
+        if meeting_metrics:
+            meeting_metrics.uploads.append({
+                "recipient": recipient,
+                "kind": kind,
+                "seconds": round(elapsed, 3),
+                "ok": ok,
+            })
+            meeting_metrics.stages["upload"] = meeting_metrics.stages.get("upload", 0) + elapsed
+            meeting_metrics.observe("upload_seconds", elapsed, kind=kind)
+
+
+def emit():
+    """Writes the summary record for the current meeting as a single JSON log line."""
+    meeting_metrics = _current.get()
+    if not meeting_metrics:
+        return
+    _current.set(None)
+    logger.info(json.dumps(meeting_metrics.record(), default=str))
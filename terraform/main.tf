@@ -203,8 +203,11 @@ resource "google_cloudfunctions2_function" "processor" {
     timeout_seconds       = 300
     service_account_email = google_service_account.transcript_sa.email
     environment_variables = {
-      GOOGLE_CLOUD_PROJECT  = var.project_id
-      GOOGLE_CLOUD_LOCATION = var.region
+      GOOGLE_CLOUD_PROJECT      = var.project_id
+      GOOGLE_CLOUD_LOCATION     = var.region
+      INCREMENTAL_SUMMARIZATION = var.incremental_summarization ? "true" : "false"
+      SUMMARY_STATE_DIR         = var.summary_state_dir
+      SUMMARY_STATE_TTL_HOURS   = tostring(var.summary_state_ttl_hours)
     }
     secret_environment_variables {
       key        = "CLIENT_ID"
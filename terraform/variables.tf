@@ -26,3 +26,21 @@ variable "tenant_id" {
   type        = string
   sensitive   = true
 }
+
+variable "incremental_summarization" {
+  description = "Keep a rolling summary per meeting and only summarize new transcript cues"
+  type        = bool
+  default     = false
+}
+
+variable "summary_state_dir" {
+  description = "Directory for the rolling summary state; must be a shared mount for state to carry across processor instances"
+  type        = string
+  default     = "/tmp/summary_state"
+}
+
+variable "summary_state_ttl_hours" {
+  description = "Hours after which unused rolling summary state is deleted"
+  type        = number
+  default     = 24
+}